@@ -0,0 +1,56 @@
+import json
+import os
+
+from . import git
+
+
+class JSONCache:
+    """
+    A key/value store persisted as a JSON file in the repo's smash dir
+
+    Values are loaded on first access and only written back by save()
+    """
+
+    def __init__(self, name: str, path: str = None):
+        """
+        Args:
+            name: the name of the cache, used for the filename
+            path: the directory to keep the cache in, defaults to the repo's smash dir
+        """
+        self.path = os.path.join(path or git.get_smash_dir(), f"{name}.json")
+
+        self._data = None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.path) as fh:
+                    self._data = json.load(fh)
+            except (FileNotFoundError, ValueError):  # missing or corrupt; start over
+                self._data = {}
+
+        return self._data
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    def save(self):
+        # write to a temp file first so that readers never see a partial file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(self.data, fh)
+
+        os.replace(tmp_path, self.path)
+
+    def set(self, key: str, value):
+        self.data[key] = value
+
+    def update(self, values: dict):
+        self.data.update(values)
@@ -20,6 +20,40 @@ def git_smash():
     parser.add_argument(
         "--reset-base", action="store_true", help="reset the branch to the base branch"
     )
+    parser.add_argument(
+        "--no-coalesce",
+        action="store_false",
+        dest="coalesce",
+        help="replay right away instead of queueing behind other replays of the branch",
+    )
+    parser.add_argument(
+        "--settle",
+        default=0,
+        type=float,
+        help="seconds to wait for more replay requests before replaying, default=0",
+    )
+    parser.add_argument(
+        "--order",
+        choices=("history", "overlap"),
+        default="history",
+        help="order to replay branches in: follow the history, or keep branches touching the same paths apart; default=history",
+    )
+    parser.add_argument(
+        "--auto-optimize",
+        action="store_true",
+        help="run the optimize action when the commit-graph is missing or stale or there are too many loose refs",
+    )
+    parser.add_argument(
+        "--continue",
+        action="store_true",
+        dest="resume",
+        help="replay: resume an interrupted replay from its last completed merge; the interrupted merge is redone, so uncommitted changes must be stashed first",
+    )
+    parser.add_argument(
+        "--abort",
+        action="store_true",
+        help="replay: give up on an interrupted replay and reset to the backup branch",
+    )
     parser.add_argument("action", help="the action to take")
 
     args = parser.parse_args()
@@ -31,7 +65,16 @@ def git_smash():
     # drop sh logging
     logger = logging.getLogger("sh").setLevel(logging.WARNING)
 
-    smash = Smash(clean_backups=args.clean, drop_branches=args.drop)
+    smash = Smash(
+        clean_backups=args.clean,
+        drop_branches=args.drop,
+        coalesce=args.coalesce,
+        settle=args.settle,
+        order=args.order,
+        auto_optimize=args.auto_optimize,
+        resume=args.resume,
+        abort=args.abort,
+    )
 
     fn = getattr(smash, args.action, None)
     if not fn:
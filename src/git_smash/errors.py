@@ -2,3 +2,9 @@ class BranchError(Exception):
     """
     Raised when there's a problem accessing branches
     """
+
+
+class HistoryError(Exception):
+    """
+    Raised when the history needed to replay cannot be fetched
+    """
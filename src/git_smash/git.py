@@ -1,5 +1,6 @@
 import functools
 import logging
+import os
 import re
 import typing
 
@@ -23,6 +24,8 @@ GIT_LOG_COMMAND = (
 )
 GIT_MERGE_COMMAND = f"{GIT_COMMAND} merge --no-edit"
 
+SMASH_DIR_NAME = "smash"
+
 MERGE_MESSAGE_RE = re.compile(
     (
         r"(?P<decoration>\(.*\) )?"
@@ -234,6 +237,24 @@ def get_branch_manager():
     return BranchManager.from_git_output(run_command(GIT_BRANCH_COMMAND))
 
 
+def get_git_dir() -> str:
+    """
+    Returns the absolute path to the repo's common git dir, shared by all worktrees
+    """
+    return os.path.abspath(run_command(f"{GIT_COMMAND} rev-parse --git-common-dir"))
+
+
+def get_smash_dir() -> str:
+    """
+    Returns the directory where git-smash keeps its state, creating it when needed
+    """
+    path = os.path.join(get_git_dir(), SMASH_DIR_NAME)
+
+    os.makedirs(path, exist_ok=True)
+
+    return path
+
+
 def get_merge_commits(
     until: str, drop: Iterable[str] = None, loglevel: str = "debug"
 ) -> list:
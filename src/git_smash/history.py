@@ -0,0 +1,190 @@
+import logging
+import os
+
+from typing import Iterable, Set
+
+from . import errors, git
+from .utils import SH_ERROR_1, run_command
+
+DEEPEN_START = 50
+DEEPEN_MAX = 10000
+FETCH_BATCH_SIZE = 1000
+NULL_REV = "0" * 40
+
+
+def is_shallow() -> bool:
+    return run_command(f"{git.GIT_COMMAND} rev-parse --is-shallow-repository") == "true"
+
+
+def get_promisor_remote() -> str:
+    """Returns the remote missing objects are fetched from, or None when not a partial clone"""
+    try:
+        output = run_command(
+            f"{git.GIT_COMMAND} config --get-regexp ^remote\\..*\\.promisor$"
+        )
+    except SH_ERROR_1:  # no promisor remotes
+        output = ""
+
+    for line in output.splitlines():
+        key, value = line.split(" ", 1)
+        if value == "true":
+            return key[len("remote.") : -len(".promisor")]
+
+    # older versions of git only record the promisor remote here
+    try:
+        return run_command(f"{git.GIT_COMMAND} config --get extensions.partialclone")
+    except SH_ERROR_1:  # not set
+        return None
+
+
+def get_remote(ref: str) -> str:
+    """
+    Returns the remote the given ref comes from
+
+    Falls back to the promisor remote, then `origin`, for local refs
+    """
+    remotes = run_command(f"{git.GIT_COMMAND} remote").splitlines()
+
+    # longest first so that `origin/foo` isn't picked for a remote named `origin/foo`
+    for remote in sorted(remotes, key=len, reverse=True):
+        if ref.startswith(f"{remote}/") or ref.startswith(f"remotes/{remote}/"):
+            return remote
+
+    remote = get_promisor_remote() or "origin"
+    if remote not in remotes:
+        raise errors.HistoryError(f"cannot find a remote to fetch history for {ref}")
+
+    return remote
+
+
+def get_shallow_commits() -> Set[str]:
+    """Returns the commits at the boundary of a shallow clone"""
+    try:
+        with open(os.path.join(git.get_git_dir(), "shallow")) as fh:
+            return set(fh.read().split())
+    except FileNotFoundError:
+        return set()
+
+
+def has_merge_base(lhs: str, rhs: str) -> bool:
+    try:
+        run_command(f"{git.GIT_COMMAND} merge-base {lhs} {rhs}")
+    except SH_ERROR_1:  # no common ancestor in the available history
+        return False
+
+    return True
+
+
+def ensure_history(
+    remote: str, base: str, revs: Iterable[str], merges: Iterable[str] = None
+) -> int:
+    """
+    Deepens a shallow clone until the history needed to replay is available
+
+    The history is complete enough when every rev shares a merge base with `base` and
+    none of the given merge commits sit on the shallow boundary, which would hide their
+    parents.  The depth is doubled on every pass; past DEEPEN_MAX the clone is unshallowed.
+
+    Args:
+        remote: the remote to fetch from
+        base: the base revision
+        revs: revisions that need a merge base with `base`
+        merges: merge commits whose parents are needed
+    Returns:
+        the number of fetches made
+    """
+    logger = logging.getLogger(__name__)
+
+    revs = list(revs)
+    merges = list(merges or [])
+
+    depth = DEEPEN_START
+    fetches = 0
+
+    while is_shallow():
+        missing = [x for x in revs if not has_merge_base(base, x)]
+        boundary = get_shallow_commits().intersection(merges)
+        if not (missing or boundary):
+            break
+
+        if depth > DEEPEN_MAX:
+            logger.info(f"history still incomplete, unshallowing from {remote}")
+
+            run_command(f"{git.GIT_COMMAND} fetch --unshallow {remote}")
+        else:
+            logger.info(
+                f"deepening by {depth}: {len(missing)} rev(s) without a merge base,"
+                f" {len(boundary)} merge(s) on the shallow boundary"
+            )
+
+            run_command(f"{git.GIT_COMMAND} fetch --deepen={depth} {remote}")
+
+        depth *= 2
+        fetches += 1
+
+    return fetches
+
+
+def get_touched_blobs(base: str, rev: str) -> Set[str]:
+    """Returns the blobs at `rev` for the paths it changed since its merge base with `base`"""
+    merge_base = run_command(f"{git.GIT_COMMAND} merge-base {base} {rev}")
+    diff = run_command(
+        f"{git.GIT_COMMAND} diff --raw --no-renames --abbrev=40 {merge_base} {rev}"
+    )
+
+    blobs = set()
+    for line in diff.splitlines():
+        # :<old mode> <new mode> <old blob> <new blob> <status>\t<path>
+        new_mode, new_blob = line.split()[1:4:2]
+        if new_blob != NULL_REV and new_mode != "160000":  # skip deletes and submodules
+            blobs.add(new_blob)
+
+    return blobs
+
+
+def get_missing_objects(revs: Iterable[str], exclude: str) -> Set[str]:
+    """Returns the objects reachable from revs, but not exclude, that are not local"""
+    revs_s = " ".join(revs)
+    output = run_command(
+        f"{git.GIT_COMMAND} rev-list --objects --no-object-names --missing=print {revs_s} ^{exclude}"
+    )
+
+    return set(x[1:] for x in output.splitlines() if x.startswith("?"))
+
+
+def prefetch_blobs(remote: str, base: str, revs: Iterable[str]) -> int:
+    """
+    Fetches the blobs the given revs touch in as few round trips as possible
+
+    Blobs not touched by the revs are left for git to fetch lazily, if ever
+
+    Returns:
+        the number of blobs fetched
+    """
+    logger = logging.getLogger(__name__)
+
+    revs = list(revs)
+    if not revs:
+        return 0
+
+    touched = set()
+    for rev in revs:
+        touched.update(get_touched_blobs(base, rev))
+
+    blobs = sorted(touched & get_missing_objects(revs, base))
+
+    for idx in range(0, len(blobs), FETCH_BATCH_SIZE):
+        batch = blobs[idx : idx + FETCH_BATCH_SIZE]
+
+        logger.debug(f"fetching {len(batch)} blob(s)")
+
+        batch = " ".join(batch)
+        run_command(
+            f"{git.GIT_COMMAND} -c fetch.negotiationAlgorithm=noop fetch --no-tags"
+            f" --no-write-fetch-head --recurse-submodules=no --filter=blob:none {remote} {batch}"
+        )
+
+    if blobs:
+        logger.info(f"fetched {len(blobs)} blob(s) touched by the merges from {remote}")
+
+    return len(blobs)
@@ -0,0 +1,57 @@
+import os
+
+from urllib.parse import quote
+
+from . import git
+from .cache import JSONCache
+
+JOURNAL_DIR_NAME = "journal"
+
+
+class Journal:
+    """
+    Checkpoints of a replay in progress, used to resume it after an interruption
+
+    The journal holds the replay plan, how many of its merges completed and the commit
+    the branch was at after the last completed merge
+    """
+
+    def __init__(self, target: str, path: str = None):
+        """
+        Args:
+            target: the name of the branch being replayed
+            path: the directory to keep the journal in, defaults to the repo's smash dir
+        """
+        self.target = target
+
+        journal_dir = os.path.join(path or git.get_smash_dir(), JOURNAL_DIR_NAME)
+        os.makedirs(journal_dir, exist_ok=True)
+
+        self._cache = JSONCache(quote(target, safe=""), path=journal_dir)
+
+    @property
+    def path(self) -> str:
+        return self._cache.path
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def checkpoint(self, data: dict, completed: int, ref: str):
+        """
+        Records that the first `completed` merges of the plan are done and the branch is at ref
+        """
+        data.update({"completed": completed, "ref": ref})
+
+        self.save(data)
+
+    def load(self) -> dict:
+        return self._cache.data
+
+    def remove(self):
+        if self.exists:
+            os.remove(self.path)
+
+    def save(self, data: dict):
+        self._cache.update(data)
+        self._cache.save()
@@ -0,0 +1,176 @@
+import logging
+import shlex
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Set
+
+from . import git, overlap
+from .cache import JSONCache
+from .utils import get_jobs, get_proc, run_command
+
+BASE_COMMITS_LIMIT = 1000
+PATCH_ID_BATCH_SIZE = 100
+PATCH_ID_CACHE_NAME = "patch-ids"
+
+
+def run_patch_id(diff: str) -> Dict[str, str]:
+    """
+    Returns the patch-id of every commit in the given diff output, keyed by commit
+
+    Commits that do not change anything have no patch-id
+    """
+    if not diff.strip():
+        return {}
+
+    proc = get_proc(f"{git.GIT_COMMAND} patch-id --stable", _in=diff)
+
+    patch_ids = {}
+    for line in proc.stdout.decode("utf8").splitlines():
+        patch_id, rev = line.split()
+        patch_ids[rev] = patch_id
+
+    return patch_ids
+
+
+def get_patch_ids(
+    revs: Iterable[str], cache: JSONCache, jobs: int = None
+) -> Dict[str, str]:
+    """
+    Returns the patch-id of each of the given commits, keyed by commit
+
+    Patch-ids are computed in parallel batches and cached by commit sha; commits that do
+    not change anything map to None
+    """
+    logger = logging.getLogger(__name__)
+
+    revs = list(revs)
+    missing = sorted(set(x for x in revs if x not in cache))
+
+    def _get_patch_ids(batch):
+        revs_s = " ".join(batch)
+        diff = run_command(f"{git.GIT_COMMAND} show --no-color --format=medium {revs_s}")
+
+        patch_ids = run_patch_id(f"{diff}\n")
+
+        return {x: patch_ids.get(x) for x in batch}
+
+    if missing:
+        logger.debug(f"computing patch-ids for {len(missing)} commit(s)")
+
+        batches = [
+            missing[idx : idx + PATCH_ID_BATCH_SIZE]
+            for idx in range(0, len(missing), PATCH_ID_BATCH_SIZE)
+        ]
+        with ThreadPoolExecutor(max_workers=get_jobs(jobs)) as executor:
+            for patch_ids in executor.map(_get_patch_ids, batches):
+                cache.update(patch_ids)
+
+    return {x: cache.get(x) for x in revs}
+
+
+def get_squash_patch_id(base: str, rev: str, cache: JSONCache) -> str:
+    """Returns the patch-id of everything rev changed since it forked from base"""
+    merge_base = run_command(f"{git.GIT_COMMAND} merge-base {base} {rev}")
+
+    key = f"{merge_base}..{rev}"
+    if key not in cache:
+        diff = run_command(f"{git.GIT_COMMAND} diff --no-color {merge_base} {rev}")
+
+        # patch-id needs a commit header to report the patch-id against
+        patch_ids = run_patch_id(f"commit {rev}\n\n{diff}\n")
+
+        cache.set(key, patch_ids.get(rev))
+
+    return cache.get(key)
+
+
+def is_landed(
+    branch_patch_ids: List[str], squash_patch_id: str, base_patch_ids: Set[str]
+) -> bool:
+    """
+    Returns whether a branch's changes are already on the base branch
+
+    Args:
+        branch_patch_ids: the patch-ids of the branch's commits
+        squash_patch_id: the patch-id of the branch's whole diff
+        base_patch_ids: the patch-ids of the base branch's commits
+    """
+    if squash_patch_id and squash_patch_id in base_patch_ids:
+        return True
+
+    branch_patch_ids = [x for x in branch_patch_ids if x]
+
+    return bool(branch_patch_ids) and set(branch_patch_ids) <= base_patch_ids
+
+
+def get_landed(
+    base: str, revs: Iterable[str], cache: JSONCache = None, jobs: int = None
+) -> Set[str]:
+    """
+    Returns the given revs whose changes landed on base as a squash merge or a rebase
+
+    Revs that are ancestors of base are not considered landed here; they are skipped
+    when replaying anyway.
+
+    Args:
+        base: the base revision
+        revs: full commit shas of the branches to check
+        cache: where to cache patch-ids, defaults to the repo's patch-id cache
+        jobs: the number of git processes to run at once
+    """
+    cache = cache or JSONCache(PATCH_ID_CACHE_NAME)
+
+    revs = list(revs)
+    if not revs:
+        return set()
+
+    # only commits that are on base but not on any of the branches, and that touch the
+    # paths the branches change, can be landed copies; limiting the walk to those paths
+    # also keeps partial clones from fetching the blobs of unrelated commits
+    changed_paths = overlap.get_changed_paths(base, revs, jobs=jobs)
+    paths = sorted(set().union(*changed_paths.values()))
+
+    base_revs = []
+    if paths:
+        revs_s = " ".join(revs)
+        paths_s = " ".join(shlex.quote(x) for x in paths)
+        base_revs = run_command(
+            f"{git.GIT_COMMAND} rev-list --no-merges --max-count={BASE_COMMITS_LIMIT} {base} --not {revs_s} -- {paths_s}"
+        ).splitlines()
+
+    def _get_branch_revs(rev):
+        return run_command(
+            f"{git.GIT_COMMAND} rev-list --no-merges {rev} ^{base} --"
+        ).splitlines()
+
+    with ThreadPoolExecutor(max_workers=get_jobs(jobs)) as executor:
+        branch_revs = dict(zip(revs, executor.map(_get_branch_revs, revs)))
+
+    all_revs = set(base_revs)
+    for items in branch_revs.values():
+        all_revs.update(items)
+
+    patch_ids = get_patch_ids(all_revs, cache, jobs=jobs)
+    base_patch_ids = set(patch_ids[x] for x in base_revs if patch_ids[x])
+
+    # branches with nothing that is not on base already are skipped
+    candidates = [x for x, items in branch_revs.items() if items]
+
+    def _get_squash_patch_id(rev):
+        return get_squash_patch_id(base, rev, cache)
+
+    with ThreadPoolExecutor(max_workers=get_jobs(jobs)) as executor:
+        squash_patch_ids = dict(
+            zip(candidates, executor.map(_get_squash_patch_id, candidates))
+        )
+
+    landed = set()
+    for rev in candidates:
+        branch_patch_ids = [patch_ids[x] for x in branch_revs[rev]]
+
+        if is_landed(branch_patch_ids, squash_patch_ids[rev], base_patch_ids):
+            landed.add(rev)
+
+    cache.save()
+
+    return landed
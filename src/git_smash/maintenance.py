@@ -0,0 +1,170 @@
+import logging
+import os
+import time
+
+from collections import OrderedDict
+from typing import Dict, List
+
+from . import git, history
+from .cache import JSONCache
+from .utils import SH_ERROR_1, run_command
+
+COMMIT_GRAPH_CACHE_NAME = "commit-graph"
+COMMIT_GRAPH_PATHS = (
+    os.path.join("objects", "info", "commit-graph"),
+    os.path.join("objects", "info", "commit-graphs", "commit-graph-chain"),
+)
+LOOSE_REFS_THRESHOLD = 100
+UNCOVERED_COMMITS_THRESHOLD = 1000
+QUERY_REPEAT = 3
+
+
+def has_commit_graph() -> bool:
+    git_dir = git.get_git_dir()
+
+    return any(os.path.exists(os.path.join(git_dir, x)) for x in COMMIT_GRAPH_PATHS)
+
+
+def get_tips(base: str) -> List[str]:
+    return run_command(f"{git.GIT_COMMAND} rev-parse HEAD {base}").splitlines()
+
+
+def count_uncovered_commits(base: str) -> int:
+    """
+    Returns the number of commits reachable from HEAD or the base tip that are not in the
+    commit-graph
+
+    The graph covers whatever was reachable from the tips recorded when it was last
+    written; for a graph written by anything else, e.g. git gc, every commit counts
+    """
+    covered = JSONCache(COMMIT_GRAPH_CACHE_NAME).get("tips", [])
+
+    return int(
+        run_command(
+            f"{git.GIT_COMMAND} rev-list --count --ignore-missing HEAD {base}"
+            f" --not {' '.join(covered)}"
+        )
+    )
+
+
+def is_commit_graph_stale(base: str) -> bool:
+    """
+    Returns whether enough commits were made since the commit-graph was written to be
+    worth another layer; a few new commits, e.g. from a replay, are cheap to walk
+    """
+    return count_uncovered_commits(base) > UNCOVERED_COMMITS_THRESHOLD
+
+
+def count_loose_refs() -> int:
+    count = 0
+    for _, _, filenames in os.walk(os.path.join(git.get_git_dir(), "refs")):
+        count += len(filenames)
+
+    return count
+
+
+def needs_optimize(base: str) -> bool:
+    """
+    Returns whether optimizing looks worth it: a missing or stale commit-graph or many
+    loose refs
+    """
+    # git does not write a commit-graph in a shallow repo, so it is never up to date
+    if history.is_shallow():
+        return False
+
+    return (
+        not has_commit_graph()
+        or is_commit_graph_stale(base)
+        or count_loose_refs() > LOOSE_REFS_THRESHOLD
+    )
+
+
+def time_queries(base: str) -> Dict[str, float]:
+    """
+    Returns the best of QUERY_REPEAT timings, in seconds, of each discovery query
+
+    The queries that need a merge base are skipped when the available history has none,
+    e.g. in a shallow clone
+
+    Args:
+        base: the base branch
+    """
+    merge_base_command = f"{git.GIT_COMMAND} merge-base HEAD {base}"
+
+    queries = OrderedDict()
+
+    try:
+        merge_base = run_command(merge_base_command)
+    except SH_ERROR_1:
+        logging.getLogger(__name__).info(
+            f"no merge base between HEAD and {base}, skipping the queries that need it"
+        )
+    else:
+        queries["merge-base"] = merge_base_command
+        queries["merges"] = f"{git.GIT_LOG_COMMAND} {merge_base}..HEAD"
+
+    queries["ancestry"] = f"{git.GIT_COMMAND} rev-list HEAD"
+    queries["branches"] = git.GIT_BRANCH_COMMAND
+
+    timings = OrderedDict()
+    for name, command in queries.items():
+        best = None
+        for _ in range(QUERY_REPEAT):
+            start = time.perf_counter()
+            run_command(command)
+            elapsed = time.perf_counter() - start
+
+            best = elapsed if best is None else min(best, elapsed)
+
+        timings[name] = best
+
+    return timings
+
+
+def write_commit_graph(base: str):
+    """
+    Writes a new commit-graph layer for commits not in the graph yet
+
+    Layers get merged as git sees fit; Bloom filters are computed for the new commits.
+    The tips covered are recorded for is_commit_graph_stale()
+    """
+    tips = get_tips(base)
+
+    run_command(
+        f"{git.GIT_COMMAND} commit-graph write --reachable --split --changed-paths"
+    )
+
+    cache = JSONCache(COMMIT_GRAPH_CACHE_NAME)
+    cache.set("tips", tips)
+    cache.save()
+
+
+def pack_refs():
+    run_command(f"{git.GIT_COMMAND} pack-refs --all")
+
+
+def optimize(base: str, timed: bool = True) -> Dict[str, tuple]:
+    """
+    Optimizes the repo and returns the (before, after) timings of each discovery query
+
+    Args:
+        base: the base branch
+        timed: whether to time the queries; timing them can cost more than optimizing
+            saves, so automatic runs skip it and get no timings back
+    """
+    logger = logging.getLogger(__name__)
+
+    before = time_queries(base) if timed else {}
+
+    if history.is_shallow():
+        logger.info("skipping commit-graph, git does not write one in a shallow repo")
+    else:
+        logger.info("writing commit-graph")
+        write_commit_graph(base)
+
+    logger.info("packing refs")
+    pack_refs()
+
+    after = time_queries(base) if timed else {}
+
+    return OrderedDict((x, (before[x], after[x])) for x in before)
@@ -0,0 +1,135 @@
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Set
+
+from . import git
+from .cache import JSONCache
+from .utils import get_jobs, run_command
+
+CHANGED_PATHS_CACHE_NAME = "changed-paths"
+
+
+def get_changed_paths(
+    base: str, revs: Iterable[str], cache: JSONCache = None, jobs: int = None
+) -> Dict[str, Set[str]]:
+    """
+    Returns the paths changed by each rev since it forked from base
+
+    Merge bases and paths are computed in parallel; paths are cached by merge base and
+    rev, so they are recomputed when the fork point moves or a different base is used
+
+    Args:
+        base: the base revision
+        revs: full commit shas to get the changed paths for
+        cache: where to cache paths, defaults to the repo's changed-paths cache
+        jobs: the number of git processes to run at once
+    """
+    logger = logging.getLogger(__name__)
+
+    cache = cache or JSONCache(CHANGED_PATHS_CACHE_NAME)
+
+    revs = list(revs)
+
+    def _get_key(rev):
+        merge_base = run_command(f"{git.GIT_COMMAND} merge-base {base} {rev}")
+
+        return f"{merge_base}..{rev}"
+
+    def _get_paths(key):
+        return run_command(
+            f"{git.GIT_COMMAND} diff --name-only --no-renames {key}"
+        ).splitlines()
+
+    with ThreadPoolExecutor(max_workers=get_jobs(jobs)) as executor:
+        keys = dict(zip(revs, executor.map(_get_key, revs)))
+
+        missing = sorted(set(x for x in keys.values() if x not in cache))
+        if missing:
+            logger.debug(f"computing changed paths for {len(missing)} rev(s)")
+
+            cache.update(zip(missing, executor.map(_get_paths, missing)))
+
+            cache.save()
+
+    return {x: set(cache.get(keys[x])) for x in revs}
+
+
+def get_overlap_graph(paths: Dict[str, Set[str]]) -> Dict[str, Dict[str, int]]:
+    """
+    Returns the number of paths each key has in common with every other key it overlaps
+    """
+    graph = {x: {} for x in paths}
+
+    keys = list(paths)
+    for idx, lhs in enumerate(keys):
+        for rhs in keys[idx + 1 :]:
+            common = len(paths[lhs] & paths[rhs])
+            if common:
+                graph[lhs][rhs] = common
+                graph[rhs][lhs] = common
+
+    return graph
+
+
+def get_groups(graph: Dict[str, Dict[str, int]]) -> List[List[str]]:
+    """
+    Returns the connected components of the overlap graph
+
+    Members keep the order of the graph and groups are ordered by their first member
+    """
+    order = {x: idx for idx, x in enumerate(graph)}
+    seen = set()
+    groups = []
+
+    for key in graph:
+        if key in seen:
+            continue
+
+        group = []
+        stack = [key]
+        seen.add(key)
+        while stack:
+            item = stack.pop()
+            group.append(item)
+
+            for neighbor in graph[item]:
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    stack.append(neighbor)
+
+        groups.append(sorted(group, key=order.get))
+
+    return groups
+
+
+def order_group(group: List[str], paths: Dict[str, Set[str]]) -> List[str]:
+    """
+    Orders a group so each next member overlaps the least with what was merged before it
+
+    The most conflict-prone members end up last; ties keep the original order
+    """
+    remaining = list(group)
+    merged_paths = set()
+    ordered = []
+
+    while remaining:
+        item = min(remaining, key=lambda x: len(paths[x] & merged_paths))
+
+        remaining.remove(item)
+        ordered.append(item)
+        merged_paths.update(paths[item])
+
+    return ordered
+
+
+def get_overlap_order(paths: Dict[str, Set[str]]) -> List[List[str]]:
+    """
+    Returns the keys of paths split into independent groups, in replay order
+
+    Groups that cannot conflict with anything else come first, bigger groups last
+    """
+    groups = get_groups(get_overlap_graph(paths))
+
+    # sorted() is stable, so groups of the same size keep their original order
+    return [order_group(x, paths) for x in sorted(groups, key=len)]
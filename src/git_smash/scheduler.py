@@ -0,0 +1,229 @@
+import fcntl
+import json
+import logging
+import os
+import time
+
+from contextlib import contextmanager
+from typing import Callable, Iterable, List
+from urllib.parse import quote
+
+from . import git
+
+QUEUE_DIR_NAME = "queue"
+REPO_LOCK_NAME = "repo.lock"
+RESULT_SUFFIX = ".result"
+TICKET_SUFFIX = ".ticket"
+
+
+@contextmanager
+def file_lock(path: str):
+    """Holds an exclusive lock on the given path, blocking until it is available"""
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield fh
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # running as another user
+        return True
+
+    return True
+
+
+class ReplayScheduler:
+    """
+    Coalesces replay requests for a target branch into as few replays as possible
+
+    Every request drops a ticket in the target's queue and then waits for the target lock.
+    Whoever holds the lock serves every ticket queued so far with the same options in a
+    single replay and records the result for each of them; requests whose ticket was
+    served while they waited simply report that result instead of replaying again.
+    """
+
+    def __init__(
+        self, target: str, path: str = None, settle: float = 0, options: dict = None
+    ):
+        """
+        Args:
+            target: the name of the branch being replayed
+            path: the directory to keep the queue in, defaults to the repo's smash dir
+            settle: seconds to wait for more requests before replaying
+            options: the options that affect the outcome of the replay
+        """
+        self.target = target
+        self.path = path or git.get_smash_dir()
+        self.settle = settle
+        self.options = options or {}
+
+        os.makedirs(self.queue_dir, exist_ok=True)
+
+    @property
+    def logger(self):
+        return logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+    @property
+    def queue_dir(self) -> str:
+        return os.path.join(self.path, QUEUE_DIR_NAME, quote(self.target, safe=""))
+
+    @property
+    def repo_lock_path(self) -> str:
+        return os.path.join(self.path, REPO_LOCK_NAME)
+
+    @property
+    def target_lock_path(self) -> str:
+        return f"{self.queue_dir}.lock"
+
+    def _get_path(self, ticket: str, suffix: str) -> str:
+        return os.path.join(self.queue_dir, f"{ticket}{suffix}")
+
+    @contextmanager
+    def exclusive(self):
+        """Holds the target and repo locks without serving any queued requests"""
+        with file_lock(self.target_lock_path), file_lock(self.repo_lock_path):
+            yield
+
+    def get_options(self, ticket: str) -> dict:
+        """Returns the options the given ticket was submitted with, None when it is gone"""
+        try:
+            with open(self._get_path(ticket, TICKET_SUFFIX)) as fh:
+                return json.load(fh)["options"]
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get_pending(self) -> List[str]:
+        """Returns the tickets waiting for a replay, oldest first"""
+        tickets = [
+            x[: -len(TICKET_SUFFIX)]
+            for x in os.listdir(self.queue_dir)
+            if x.endswith(TICKET_SUFFIX)
+        ]
+
+        return sorted(tickets)
+
+    def pop_result(self, ticket: str):
+        """Returns the recorded result for the given ticket, or None when not served yet"""
+        path = self._get_path(ticket, RESULT_SUFFIX)
+
+        try:
+            with open(path) as fh:
+                result = json.load(fh)
+        except FileNotFoundError:
+            return None
+
+        os.remove(path)
+
+        return result
+
+    def prune(self):
+        """Removes the tickets and results of requests whose process is gone"""
+        for filename in os.listdir(self.queue_dir):
+            ticket, suffix = os.path.splitext(filename)
+            if suffix not in (RESULT_SUFFIX, TICKET_SUFFIX):
+                continue
+
+            if not is_running(int(ticket.rsplit("-", 1)[-1])):
+                self.logger.debug(f"pruning {filename}, its process is gone")
+
+                os.remove(os.path.join(self.queue_dir, filename))
+
+    def record_result(self, tickets: Iterable[str], result: dict):
+        for ticket in tickets:
+            # the request gave up waiting in the meantime; nobody would read the result
+            if not self.discard(ticket):
+                continue
+
+            with open(self._get_path(ticket, RESULT_SUFFIX), "w") as fh:
+                json.dump(result, fh)
+
+    def discard(self, ticket: str) -> bool:
+        """
+        Removes the given ticket from the queue without recording a result
+
+        Returns:
+            whether the ticket was still queued
+        """
+        try:
+            os.remove(self._get_path(ticket, TICKET_SUFFIX))
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def submit(self) -> str:
+        """Queues a replay request and returns its ticket"""
+        ticket = f"{int(time.time() * 1e9):020d}-{os.getpid()}"
+
+        with open(self._get_path(ticket, TICKET_SUFFIX), "w") as fh:
+            json.dump({"target": self.target, "options": self.options}, fh)
+
+        return ticket
+
+    def run(self, fn: Callable[[], int]) -> int:
+        """
+        Queues a request and returns the status of the replay that served it
+
+        Args:
+            fn: the function performing the replay; its return value is the status
+        """
+        ticket = self.submit()
+
+        self.logger.debug(f"queued replay request {ticket} for {self.target}")
+
+        try:
+            return self._run(ticket, fn)
+        finally:
+            # when interrupted, e.g. while waiting for the lock, the ticket must not stay
+            # queued and a result recorded for it meanwhile must not be left behind
+            self.discard(ticket)
+            self.pop_result(ticket)
+
+    def _run(self, ticket: str, fn: Callable[[], int]) -> int:
+        with file_lock(self.target_lock_path):
+            result = self.pop_result(ticket)
+            if result is not None:
+                self.logger.info(
+                    f"request coalesced into replay {result['ticket']}, status={result['status']}"
+                )
+
+                return result["status"]
+
+            if self.settle:
+                self.logger.info(f"waiting {self.settle}s for more replay requests")
+
+                time.sleep(self.settle)
+
+            self.prune()
+
+            # requests made with other options are left queued for a replay of their own
+            options = self.get_options(ticket)
+            tickets = [
+                x
+                for x in self.get_pending()
+                if x == ticket or self.get_options(x) == options
+            ]
+
+            self.logger.info(f"replaying {self.target} for {len(tickets)} request(s)")
+
+            others = [x for x in tickets if x != ticket]
+
+            with file_lock(self.repo_lock_path):
+                # when interrupted (e.g. KeyboardInterrupt) the other requests are left
+                # queued so that one of them retries the replay
+                try:
+                    status = fn()
+                except Exception:
+                    self.record_result(others, {"ticket": ticket, "status": 1})
+
+                    raise
+
+                self.record_result(others, {"ticket": ticket, "status": status})
+
+        return status
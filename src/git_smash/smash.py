@@ -4,7 +4,10 @@ from typing import List
 
 import sh
 
-from . import git
+from . import git, history, landed, maintenance, overlap
+from .cache import JSONCache
+from .journal import Journal
+from .scheduler import ReplayScheduler
 from .utils import (
     SH_ERROR_1,
     run_command,
@@ -12,6 +15,11 @@ from .utils import (
     run_interactive_shell,
 )
 
+REPLAYS_CACHE_NAME = "replays"
+
+# returned by replay when the branch ends up with the same content it had before
+UNCHANGED_EXIT_STATUS = 3
+
 
 class Smash:
     def __init__(
@@ -19,10 +27,84 @@ class Smash:
         clean_backups: bool = True,
         drop_branches: List[str] = None,
         base_branch: str = "origin/master",
+        coalesce: bool = True,
+        settle: float = 0,
+        order: str = "history",
+        auto_optimize: bool = False,
+        resume: bool = False,
+        abort: bool = False,
     ):
         self.base_branch_name = base_branch
         self.clean_backups = clean_backups
         self.drop_branches = drop_branches
+        self.coalesce = coalesce
+        self.settle = settle
+        self.order = order
+        self.auto_optimize = auto_optimize
+        self.resume = resume
+        self.abort = abort
+
+        self._full_history = False
+
+    def _abort_replay(self):
+        """Resets the branch to its backup and forgets about the interrupted replay"""
+        current_branch = git.BranchManager.get_current_branch()
+
+        journal = Journal(current_branch.name)
+        if not journal.exists:
+            return f"ERROR: there is no interrupted replay of {current_branch} to abort"
+
+        data = journal.load()
+
+        self.logger.info(f"resetting {current_branch} to {data['backup']}")
+
+        run_command(f"git reset --hard {data['backup']}")
+
+        journal.remove()
+
+    def _apply_plan(self, journal: Journal, data: dict):
+        """
+        Applies the merges in the plan that are not completed yet, checkpointing each one
+
+        Once all merges are applied, the branch is compared with its backup and the
+        journal is removed
+        """
+        plan = data["plan"]
+
+        for idx in range(data["completed"], len(plan)):
+            item = plan[idx]
+
+            commit = git.Commit(item["merge"], item["message"])
+            branch = git.Branch(item["branch"], commit=git.Commit(item["rev"], None))
+
+            self.apply_branch(branch, merge_commit=commit)
+
+            journal.checkpoint(data, idx + 1, run_command("git rev-parse HEAD"))
+
+        status = None
+
+        # a replay generates new commit hashes even when the content is the same; keep the
+        # original commits in that case so nothing downstream sees a change
+        backup_branch = data["backup"]
+        if self.get_merge_trees("HEAD") == self.get_merge_trees(backup_branch):
+            self.logger.info(
+                f"replay produced the same trees as {backup_branch}, restoring its commits"
+            )
+
+            run_command(f"git reset --hard {backup_branch}")
+
+            status = UNCHANGED_EXIT_STATUS
+
+        replays = JSONCache(REPLAYS_CACHE_NAME)
+        replays.set(
+            journal.target,
+            {"inputs": data["inputs"], "result": run_command("git rev-parse HEAD")},
+        )
+        replays.save()
+
+        journal.remove()
+
+        return status
 
     def apply_branch(self, branch, merge_commit=None):
         """Attempt to merge the found branch,  name or fallback to the merge commit"""
@@ -102,10 +184,58 @@ class Smash:
     def logger(self):
         return logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
+    def ensure_history(self, revs: List[str], merges: List[str] = None) -> int:
+        """
+        Deepens a shallow clone until the given revs and merges can be replayed
+
+        Returns:
+            the number of fetches made, 0 when the clone is not shallow
+        """
+        # a complete history does not become shallow again, no need to check it every time
+        if self._full_history:
+            return 0
+
+        if not history.is_shallow():
+            self._full_history = True
+
+            return 0
+
+        remote = history.get_remote(self.base_branch_name)
+
+        return history.ensure_history(remote, self.base_branch_name, revs, merges)
+
+    def get_landed(self, revs: List[str]) -> set:
+        """
+        Returns the revs that landed on the base branch through a squash merge or rebase
+        """
+        return landed.get_landed(self.base_branch_name, revs)
+
+    def get_merge_trees(self, rev: str) -> List[str]:
+        """
+        Returns the tree of rev followed by the tree of each first-parent commit down to
+        the base branch
+        """
+        trees = run_command(
+            f"{git.GIT_COMMAND} log --first-parent --format=%T {self.base_branch_name}..{rev} --"
+        ).splitlines()
+
+        return [run_command(f"{git.GIT_COMMAND} rev-parse {rev}^{{tree}}")] + trees
+
     def get_merges(self, simplify: bool = True) -> list:
-        self.logger.info(f"looking for merge commits until {self.base_rev}")
+        self.ensure_history(["HEAD"])
+
+        # optimizing times queries that need the merge base, so it comes after history
+        if self.auto_optimize and maintenance.needs_optimize(self.base_branch_name):
+            self.optimize(timed=False)
+
+        base_rev = self.base_rev
+        self.logger.info(f"looking for merge commits until {base_rev}")
+
+        merges = git.get_merge_commits(base_rev, drop=self.drop_branches)
+        if self.ensure_history([], merges=[x.rev for x in merges]):
+            # deepening can uncover merges that were cut off by the shallow boundary
+            merges = git.get_merge_commits(base_rev, drop=self.drop_branches)
 
-        merges = git.get_merge_commits(self.base_rev, drop=self.drop_branches)
         self.logger.debug("all merges:")
         for merge in merges:
             self.logger.debug(f"\t{merge}")
@@ -116,28 +246,152 @@ class Smash:
         return merges
 
     def list(self):
-        merges = self.get_merges()
+        merges = list(self.get_merges())
+
+        landed_revs = self.get_landed([x.merge_rhs for x in merges])
 
         self.logger.info("merges:")
 
         for merge in merges:
+            if merge.merge_rhs in landed_revs:
+                continue
+
             self.logger.info(f"\t{merge}")
 
+        if landed_revs:
+            self.logger.info(f"landed on {self.base_branch_name}:")
+
+            for merge in merges:
+                if merge.merge_rhs in landed_revs:
+                    self.logger.info(f"\t{merge}")
+
     @property
     def master_rev(self):
         """Returns the master revison"""
         return run_command(f"git rev-list {self.base_branch_name} --max-count 1")
 
+    def optimize(self, timed: bool = True):
+        """
+        Writes the commit-graph and packs refs to speed up finding merges
+        """
+        timings = maintenance.optimize(self.base_branch_name, timed=timed)
+        if not timings:
+            return
+
+        self.logger.info("query timings, before -> after:")
+
+        for name, (before, after) in timings.items():
+            self.logger.info(f"\t{name}: {before * 1000:.1f}ms -> {after * 1000:.1f}ms")
+
+    def order_by_overlap(self, branches_to_merge: list) -> list:
+        """
+        Reorders the branches so the ones touching the same paths are merged apart
+
+        Branches are split into groups that do not touch any of the same paths; the
+        groups are independent of each other and can be merged or tested on their own
+        """
+        branches_by_rev = {}
+        for item in branches_to_merge:
+            branches_by_rev.setdefault(item[1].commit.rev, []).append(item)
+
+        paths = overlap.get_changed_paths(self.base_branch_name, branches_by_rev)
+        groups = overlap.get_overlap_order(paths)
+
+        ordered = []
+        for idx, group in enumerate(groups):
+            group_branches = [x for rev in group for x in branches_by_rev[rev]]
+
+            branches_s = ", ".join([x.name for _, x in group_branches])
+            self.logger.info(f"group {idx + 1}: {branches_s}")
+
+            ordered.extend(group_branches)
+
+        return ordered
+
     def replay(self):
-        on_base = self.base_rev == self.master_rev
-        if not on_base:
-            # TODO: rebase on base branch based on optional arg
-            self.logger.warning(f"this branch is not on top of {self.base_branch_name}")
+        """
+        Replays the merges found in the current branch on top of the base branch
+
+        Unless coalescing is disabled, concurrent requests to replay the same branch are
+        queued and served by a single replay.  Continuing or aborting an interrupted
+        replay only waits for the locks.
+        """
+        if self.resume:
+            fn = self._continue_replay
+        elif self.abort:
+            fn = self._abort_replay
+        else:
+            fn = self._replay
+
+        if not self.coalesce:
+            return fn()
+
+        current_branch = git.BranchManager.get_current_branch()
+        scheduler = ReplayScheduler(
+            current_branch.name, settle=self.settle, options=self.replay_options
+        )
+
+        if fn == self._replay:
+            return scheduler.run(fn)
+
+        with scheduler.exclusive():
+            return fn()
+
+    @property
+    def replay_options(self) -> dict:
+        """Returns the options that affect the outcome of a replay"""
+        return {
+            "base_branch": self.base_branch_name,
+            "clean_backups": self.clean_backups,
+            "drop_branches": sorted(self.drop_branches or []),
+            "order": self.order,
+        }
+
+    def _continue_replay(self):
+        """Resumes an interrupted replay from its last checkpoint"""
+        current_branch = git.BranchManager.get_current_branch()
+
+        journal = Journal(current_branch.name)
+        if not journal.exists:
+            return f"ERROR: there is no interrupted replay of {current_branch} to continue"
+
+        # resetting to the checkpoint would discard them, e.g. a conflict resolution
+        if run_command(f"{git.GIT_COMMAND} status --porcelain --untracked-files=no"):
+            return (
+                f"ERROR: {current_branch} has uncommitted changes that continuing would"
+                " discard; stash them, or reset them to redo the interrupted merge"
+            )
+
+        data = journal.load()
+
+        # anything after the checkpoint, e.g. a merge left half done, is redone
+        self.logger.info(
+            f"resuming at merge {data['completed'] + 1} of {len(data['plan'])},"
+            f" resetting {current_branch} to {data['ref']}"
+        )
+
+        run_command(f"git reset --hard {data['ref']}")
+
+        return self._apply_plan(journal, data)
+
+    def _replay(self):
+        journal = Journal(git.BranchManager.get_current_branch().name)
+        if journal.exists:
+            return (
+                f"ERROR: a replay of {journal.target} was interrupted;"
+                " run `git-smash replay --continue` or `git-smash replay --abort`"
+            )
 
         self.logger.info("find merge commits:")
 
+        # finding the merges makes sure the history is there for base_rev
         commits = self.get_merges()
 
+        on_base = self.base_rev == self.master_rev
+        if not on_base:
+            # TODO: rebase on base branch based on optional arg
+            self.logger.warning(f"this branch is not on top of {self.base_branch_name}")
+
         branch_manager = git.get_branch_manager()
         current_branch = branch_manager.get_current_branch()
 
@@ -169,6 +423,43 @@ class Smash:
         # apply the branches backwards
         branches_to_merge.reverse()
 
+        tips = [x.commit.rev for _, x in branches_to_merge]
+        self.ensure_history(tips)
+
+        # the branch is left as is when neither the base nor any branch moved since
+        # the last replay produced it
+        last_replay = JSONCache(REPLAYS_CACHE_NAME).get(current_branch.name)
+
+        inputs = {"base": self.master_rev, "tips": tips, "order": self.order}
+        head_rev = run_command("git rev-parse HEAD")
+        if last_replay == {"inputs": inputs, "result": head_rev}:
+            self.logger.info(
+                f"nothing moved since {current_branch} was last replayed, skipping"
+            )
+
+            return UNCHANGED_EXIT_STATUS
+
+        # fetch the blobs the merges touch up front; the landed check needs them too
+        promisor_remote = history.get_promisor_remote()
+        if promisor_remote:
+            history.prefetch_blobs(promisor_remote, self.base_branch_name, tips)
+
+        # skip branches that were squashed or rebased onto the base branch
+        landed_revs = self.get_landed(tips)
+        if landed_revs:
+            for (commit, branch), rev in zip(list(branches_to_merge), tips):
+                if rev in landed_revs:
+                    self.logger.info(
+                        f"{branch.info} already landed on {self.base_branch_name}, skipping"
+                    )
+
+                    branches_to_merge.remove((commit, branch))
+
+            tips = [x for x in tips if x not in landed_revs]
+
+        if self.order == "overlap":
+            branches_to_merge = self.order_by_overlap(branches_to_merge)
+
         branches_s = "\n\t".join([x.info for _, x in branches_to_merge])
         self.logger.info(f"branches to merge:\n\t{branches_s}")
 
@@ -208,5 +499,19 @@ class Smash:
 
         run_command(f"git reset --hard {base}")
 
-        for commit, branch in branches_to_merge:
-            self.apply_branch(branch, merge_commit=commit)
+        data = {
+            "backup": backup_branch,
+            "inputs": inputs,
+            "plan": [
+                {
+                    "merge": commit.rev,
+                    "message": commit.message,
+                    "branch": branch.name,
+                    "rev": branch.commit.rev,
+                }
+                for commit, branch in branches_to_merge
+            ],
+        }
+        journal.checkpoint(data, 0, run_command("git rev-parse HEAD"))
+
+        return self._apply_plan(journal, data)
@@ -1,11 +1,19 @@
 import logging
+import os
 import sh
 import shlex
 import string
 
+MAX_JOBS = 8
+
 SH_ERROR_1 = getattr(sh, "ErrorReturnCode_1")
 
 
+def get_jobs(jobs: int = None) -> int:
+    """Returns the number of git processes to run at once"""
+    return jobs or min(MAX_JOBS, os.cpu_count() or 1)
+
+
 def get_proc(command: str, **kwargs):
     command_split = shlex.split(command)
 
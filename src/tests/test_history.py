@@ -0,0 +1,128 @@
+import os
+
+from git_smash import history, landed, maintenance
+from git_smash.smash import Smash
+
+from tests.utils import GitRepoTestCase, commit_file, git
+
+
+class ShallowPartialCloneTestCase(GitRepoTestCase):
+    """
+    Runs against a blobless, depth=1 clone of a local file:// origin where the env branch
+    is a few commits behind master and has a feature branch merged in
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        self.origin = os.path.join(self.tempdir, "origin")
+        os.makedirs(self.origin)
+
+        git(self.origin, "init", "-q", "-b", "master")
+        git(self.origin, "config", "uploadpack.allowfilter", "true")
+
+        for idx in range(5):
+            commit_file(self.origin, f"base-{idx}")
+
+        git(self.origin, "checkout", "-q", "-b", "feature/one")
+        commit_file(self.origin, "feature-one")
+
+        # never checked out in the clone, so its blobs stay on the origin
+        git(self.origin, "checkout", "-q", "-b", "feature/two", "master")
+        commit_file(self.origin, "feature-two")
+
+        git(self.origin, "checkout", "-q", "-b", "env/dev", "master")
+        git(self.origin, "merge", "--no-ff", "--no-edit", "feature/one")
+        self.merge_rev = git(self.origin, "rev-parse", "HEAD")
+
+        git(self.origin, "checkout", "-q", "master")
+        for idx in range(5):
+            commit_file(self.origin, f"master-{idx}")
+
+        self.clone = os.path.join(self.tempdir, "clone")
+        git(
+            self.tempdir,
+            "clone",
+            "-q",
+            "--depth=1",
+            "--no-single-branch",
+            "--filter=blob:none",
+            f"file://{self.origin}",
+            self.clone,
+        )
+        git(self.clone, "checkout", "-q", "env/dev")
+
+        os.chdir(self.clone)
+
+    def test_clone_is_shallow_and_partial(self, *mocks):
+        self.assertTrue(history.is_shallow())
+        self.assertEquals("origin", history.get_promisor_remote())
+        self.assertFalse(history.has_merge_base("HEAD", "origin/master"))
+
+    def test_ensure_history_deepens_to_merge_base(self, *mocks):
+        fetches = history.ensure_history(
+            "origin", "origin/master", ["HEAD"], merges=[self.merge_rev]
+        )
+
+        self.assertTrue(fetches > 0)
+        self.assertTrue(history.has_merge_base("HEAD", "origin/master"))
+        self.assertNotIn(self.merge_rev, history.get_shallow_commits())
+
+        # a second pass has nothing left to fetch
+        self.assertEquals(
+            0, history.ensure_history("origin", "origin/master", ["HEAD"])
+        )
+
+    def test_prefetch_blobs_fetches_touched_blobs(self, *mocks):
+        history.ensure_history("origin", "origin/master", ["origin/feature/two"])
+
+        blobs = history.get_touched_blobs("origin/master", "origin/feature/two")
+        self.assertEquals(1, len(blobs))
+
+        self.assertEquals(
+            1, history.prefetch_blobs("origin", "origin/master", ["origin/feature/two"])
+        )
+        self.assertEquals(
+            set(), history.get_missing_objects(blobs, "origin/master") & blobs
+        )
+
+    def test_get_landed_does_not_fetch_unrelated_blobs(self, *mocks):
+        git(self.origin, "checkout", "-q", "master")
+        for idx in range(2):
+            commit_file(self.origin, "notes", f"{idx}\n")
+
+        git(self.clone, "fetch", "-q", "origin")
+        history.ensure_history("origin", "origin/master", ["origin/feature/two"])
+
+        missing = history.get_missing_objects(["origin/master"], "origin/feature/two")
+        self.assertEquals(2, len(missing))
+
+        feature_rev = git(self.clone, "rev-parse", "origin/feature/two")
+        landed.get_landed("origin/master", [feature_rev])
+
+        # the versions of notes were never checked out and no branch touches them
+        self.assertEquals(
+            missing,
+            history.get_missing_objects(["origin/master"], "origin/feature/two"),
+        )
+
+    def test_get_merges_in_shallow_clone(self, *mocks):
+        merges = list(Smash().get_merges())
+
+        self.assertEquals(1, len(merges))
+        self.assertEquals("feature/one", merges[0].merge_branch)
+        self.assertEquals(self.merge_rev, merges[0].rev)
+
+    def test_get_merges_auto_optimize_in_shallow_clone(self, *mocks):
+        # git does not write a commit-graph in a shallow repo; optimizing is skipped
+        self.assertFalse(maintenance.needs_optimize("origin/master"))
+
+        merges = list(Smash(auto_optimize=True).get_merges())
+        self.assertEquals(1, len(merges))
+
+    def test_optimize_in_shallow_clone(self, *mocks):
+        timings = maintenance.optimize("origin/master")
+
+        # there is no merge base in the depth=1 history
+        self.assertEquals(["ancestry", "branches"], list(timings))
+        self.assertFalse(maintenance.has_commit_graph())
@@ -0,0 +1,96 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+from git_smash import landed
+from git_smash.cache import JSONCache
+
+from tests.utils import GitRepoTestCase, commit_file, git
+
+
+class IsLandedTestCase(TestCase):
+    def test_rebased(self, *mocks):
+        self.assertTrue(landed.is_landed(["a", "b"], "s", {"a", "b", "c"}))
+
+    def test_partially_rebased(self, *mocks):
+        self.assertFalse(landed.is_landed(["a", "b"], "s", {"a", "c"}))
+
+    def test_squashed(self, *mocks):
+        self.assertTrue(landed.is_landed(["a", "b"], "s", {"s", "c"}))
+
+    def test_empty_commits_are_not_landed(self, *mocks):
+        self.assertFalse(landed.is_landed([None], None, {"a"}))
+
+
+class GetLandedTestCase(GitRepoTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.repo = self.tempdir
+        self.cache = JSONCache("patch-ids", path=self.repo)
+
+        git(self.repo, "init", "-q", "-b", "master")
+        commit_file(self.repo, "base")
+
+        self.revs = {}
+        for name in ("rebased", "squashed", "open"):
+            git(self.repo, "checkout", "-q", "-b", name, "master")
+            commit_file(self.repo, f"{name}-1")
+            commit_file(self.repo, f"{name}-2")
+
+            self.revs[name] = git(self.repo, "rev-parse", "HEAD")
+
+        git(self.repo, "checkout", "-q", "master")
+        commit_file(self.repo, "master-1")
+
+        git(self.repo, "cherry-pick", "master..rebased")
+
+        git(self.repo, "merge", "-q", "--squash", "squashed")
+        git(self.repo, "commit", "-q", "-m", "squashed")
+
+        os.chdir(self.repo)
+
+    def test_get_landed(self, *mocks):
+        revs = list(self.revs.values())
+
+        result = landed.get_landed("master", revs, cache=self.cache)
+
+        self.assertEquals({self.revs["rebased"], self.revs["squashed"]}, result)
+
+    def test_get_landed_uses_cache(self, *mocks):
+        revs = list(self.revs.values())
+
+        landed.get_landed("master", revs, cache=self.cache)
+
+        # the patch-ids are persisted, nothing has to be computed again
+        cache = JSONCache("patch-ids", path=self.repo)
+        with mock.patch.object(landed, "run_patch_id") as run_patch_id:
+            result = landed.get_landed("master", revs, cache=cache)
+
+        run_patch_id.assert_not_called()
+        self.assertEquals(2, len(result))
+
+    def test_get_landed_skips_unrelated_base_commits(self, *mocks):
+        """Base commits not touching the branches' paths are never shown"""
+        revs = list(self.revs.values())
+        unrelated_rev = git(self.repo, "rev-list", "-1", "master", "--", "master-1")
+
+        with mock.patch.object(
+            landed, "get_patch_ids", side_effect=landed.get_patch_ids
+        ) as get_patch_ids:
+            landed.get_landed("master", revs, cache=self.cache)
+
+        self.assertNotIn(unrelated_rev, get_patch_ids.call_args[0][0])
+
+    def test_get_landed_runs_branches_in_parallel(self, *mocks):
+        """Branch commits, patch-ids and squash patch-ids are each computed in a pool"""
+        revs = list(self.revs.values())
+
+        with mock.patch.object(
+            landed, "ThreadPoolExecutor", side_effect=ThreadPoolExecutor
+        ) as executor:
+            result = landed.get_landed("master", revs, cache=self.cache, jobs=3)
+
+        self.assertEquals([mock.call(max_workers=3)] * 3, executor.call_args_list)
+        self.assertEquals({self.revs["rebased"], self.revs["squashed"]}, result)
@@ -0,0 +1,74 @@
+import os
+
+from unittest import mock
+
+from git_smash import maintenance
+
+from tests.utils import GitRepoTestCase, commit_file, git
+
+
+class OptimizeTestCase(GitRepoTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.repo = self.tempdir
+
+        git(self.repo, "init", "-q", "-b", "master")
+        for idx in range(3):
+            commit_file(self.repo, f"base-{idx}")
+
+        os.chdir(self.repo)
+
+    def test_optimize(self, *mocks):
+        self.assertTrue(maintenance.needs_optimize("master"))
+
+        timings = maintenance.optimize("master")
+
+        self.assertEquals(
+            ["merge-base", "merges", "ancestry", "branches"], list(timings)
+        )
+        self.assertTrue(maintenance.has_commit_graph())
+        self.assertEquals(0, maintenance.count_loose_refs())
+        self.assertFalse(maintenance.needs_optimize("master"))
+
+    def test_optimize_is_incremental(self, *mocks):
+        maintenance.optimize("master")
+
+        commit_file(self.repo, "base-4")
+        maintenance.optimize("master")
+
+        # the layers written so far form a valid chain covering the new commit
+        git(self.repo, "commit-graph", "verify")
+        self.assertFalse(maintenance.needs_optimize("master"))
+
+    def test_needs_optimize_stale_commit_graph(self, *mocks):
+        maintenance.optimize("master")
+
+        commit_file(self.repo, "base-4")
+
+        # a few commits past the graph, e.g. from a replay, are not worth another layer
+        self.assertEquals(1, maintenance.count_uncovered_commits("master"))
+        self.assertFalse(maintenance.needs_optimize("master"))
+
+        with mock.patch.object(maintenance, "UNCOVERED_COMMITS_THRESHOLD", 0):
+            self.assertTrue(maintenance.needs_optimize("master"))
+
+            maintenance.optimize("master")
+            self.assertFalse(maintenance.needs_optimize("master"))
+
+    def test_optimize_untimed(self, *mocks):
+        with mock.patch.object(
+            maintenance, "time_queries", side_effect=maintenance.time_queries
+        ) as time_queries:
+            self.assertEquals({}, maintenance.optimize("master", timed=False))
+
+        time_queries.assert_not_called()
+        self.assertTrue(maintenance.has_commit_graph())
+
+    def test_time_queries_without_merge_base(self, *mocks):
+        git(self.repo, "checkout", "-q", "--orphan", "unrelated")
+        commit_file(self.repo, "unrelated")
+
+        self.assertEquals(
+            ["ancestry", "branches"], list(maintenance.time_queries("master"))
+        )
@@ -0,0 +1,87 @@
+import tempfile
+
+from unittest import TestCase, mock
+
+from git_smash import overlap
+from git_smash.cache import JSONCache
+
+PATHS = {
+    "feature/a": {"api/views.py", "api/urls.py"},
+    "feature/b": {"README.md"},
+    "feature/c": {"api/views.py"},
+    "feature/d": {"api/urls.py", "web/index.html"},
+    "feature/e": {"web/app.js"},
+}
+
+
+class OverlapTestCase(TestCase):
+    def test_get_overlap_graph(self, *mocks):
+        graph = overlap.get_overlap_graph(PATHS)
+
+        self.assertEquals({"feature/c": 1, "feature/d": 1}, graph["feature/a"])
+        self.assertEquals({}, graph["feature/b"])
+        self.assertEquals({"feature/a": 1}, graph["feature/d"])
+
+    def test_get_groups(self, *mocks):
+        groups = overlap.get_groups(overlap.get_overlap_graph(PATHS))
+
+        self.assertEquals(
+            [["feature/a", "feature/c", "feature/d"], ["feature/b"], ["feature/e"]],
+            groups,
+        )
+
+    def test_get_overlap_order(self, *mocks):
+        """
+        Independent branches go first and overlapping ones are merged apart
+        """
+        paths = dict(PATHS)
+        paths["feature/f"] = {"api/views.py", "api/urls.py", "web/index.html"}
+
+        groups = overlap.get_overlap_order(paths)
+
+        self.assertEquals(["feature/b"], groups[0])
+        self.assertEquals(["feature/e"], groups[1])
+
+        # c and d do not touch the same paths, so they both go ahead of f, which overlaps everything
+        self.assertEquals(
+            ["feature/a", "feature/c", "feature/d", "feature/f"], groups[2]
+        )
+
+    def _run_command(self, command):
+        if " merge-base " in command:
+            return "base"
+
+        return "setup.py"
+
+    def test_get_changed_paths_uses_cache(self, *mocks):
+        with tempfile.TemporaryDirectory() as path:
+            cache = JSONCache("paths", path=path)
+            cache.set("base..abc", ["README.md"])
+
+            with mock.patch.object(
+                overlap, "run_command", side_effect=self._run_command
+            ) as run_command:
+                paths = overlap.get_changed_paths("master", ["abc", "def"], cache=cache)
+
+            self.assertEquals({"abc": {"README.md"}, "def": {"setup.py"}}, paths)
+
+            # two merge bases, but only one diff
+            self.assertEquals(3, run_command.call_count)
+
+            # the computed paths are persisted
+            self.assertEquals(
+                ["setup.py"], JSONCache("paths", path=path).get("base..def")
+            )
+
+    def test_get_changed_paths_fork_point_moved(self, *mocks):
+        """Paths cached for an older fork point are not reused"""
+        with tempfile.TemporaryDirectory() as path:
+            cache = JSONCache("paths", path=path)
+            cache.set("old-base..abc", ["README.md"])
+
+            with mock.patch.object(
+                overlap, "run_command", side_effect=self._run_command
+            ):
+                paths = overlap.get_changed_paths("master", ["abc"], cache=cache)
+
+            self.assertEquals({"abc": {"setup.py"}}, paths)
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import tempfile
+
+from unittest import TestCase, mock
+
+from git_smash.scheduler import ReplayScheduler
+
+
+class ReplaySchedulerTestCase(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+
+    def _get_scheduler(self, target="env/dev", options=None):
+        return ReplayScheduler(target, path=self.tempdir.name, options=options)
+
+    def test_run_serves_queued_requests(self, *mocks):
+        """A single replay serves every request queued before it started"""
+        scheduler = self._get_scheduler()
+
+        waiting = [scheduler.submit() for _ in range(3)]
+        replay = mock.Mock(return_value=0)
+
+        self.assertEquals(0, scheduler.run(replay))
+        self.assertEquals(1, replay.call_count)
+        self.assertEquals([], scheduler.get_pending())
+
+        for ticket in waiting:
+            self.assertEquals(0, scheduler.pop_result(ticket)["status"])
+
+    def test_run_coalesced_request_does_not_replay(self, *mocks):
+        scheduler = self._get_scheduler()
+
+        # another replay already served the request while it waited for the lock
+        ticket = scheduler.submit()
+        scheduler.record_result([ticket], {"ticket": "0000-1", "status": 3})
+
+        replay = mock.Mock()
+
+        with mock.patch.object(scheduler, "submit", return_value=ticket):
+            self.assertEquals(3, scheduler.run(replay))
+
+        replay.assert_not_called()
+
+    def test_run_failure_is_reported_to_waiters(self, *mocks):
+        scheduler = self._get_scheduler()
+
+        ticket = scheduler.submit()
+        replay = mock.Mock(side_effect=RuntimeError("boom"))
+
+        with self.assertRaises(RuntimeError):
+            scheduler.run(replay)
+
+        self.assertEquals(1, scheduler.pop_result(ticket)["status"])
+        self.assertEquals([], scheduler.get_pending())
+
+    def test_run_serves_only_requests_with_the_same_options(self, *mocks):
+        scheduler = self._get_scheduler(options={"drop_branches": []})
+        other = self._get_scheduler(options={"drop_branches": ["feature/x"]})
+
+        same = scheduler.submit()
+        different = other.submit()
+
+        self.assertEquals(0, scheduler.run(mock.Mock(return_value=0)))
+        self.assertEquals(0, scheduler.pop_result(same)["status"])
+
+        # the request dropping a branch is left queued to replay on its own
+        self.assertEquals(None, other.pop_result(different))
+        self.assertEquals([different], scheduler.get_pending())
+
+    def test_targets_are_queued_separately(self, *mocks):
+        scheduler = self._get_scheduler("env/dev")
+        other = self._get_scheduler("env/staging")
+
+        scheduler.submit()
+
+        self.assertEquals([], other.get_pending())
+
+    def test_run_interrupted_wait_leaves_nothing_queued(self, *mocks):
+        scheduler = self._get_scheduler()
+
+        with mock.patch(
+            "git_smash.scheduler.file_lock", side_effect=KeyboardInterrupt()
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                scheduler.run(mock.Mock())
+
+        self.assertEquals([], os.listdir(scheduler.queue_dir))
+
+    def test_run_prunes_requests_of_dead_processes(self, *mocks):
+        scheduler = self._get_scheduler()
+
+        proc = subprocess.Popen(["true"])
+        proc.wait()
+
+        with open(scheduler._get_path(f"0000-{proc.pid}", ".ticket"), "w"):
+            pass
+
+        self.assertEquals(0, scheduler.run(mock.Mock(return_value=0)))
+
+        self.assertEquals([], os.listdir(scheduler.queue_dir))
+
+    def test_record_result_skips_discarded_tickets(self, *mocks):
+        scheduler = self._get_scheduler()
+
+        ticket = scheduler.submit()
+        scheduler.discard(ticket)
+
+        scheduler.record_result([ticket], {"ticket": "0000-1", "status": 0})
+
+        self.assertEquals(None, scheduler.pop_result(ticket))
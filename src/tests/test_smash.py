@@ -0,0 +1,198 @@
+import os
+
+from unittest import mock
+
+from git_smash import maintenance, smash
+from git_smash.cache import JSONCache
+from git_smash.journal import Journal
+from git_smash.scheduler import ReplayScheduler
+
+from tests.utils import GitRepoTestCase, commit_file, git
+
+
+class ReplayTestCase(GitRepoTestCase):
+    """
+    Runs against a clone where env/dev has two feature branches merged in and is a commit
+    behind origin/master
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        self.origin = os.path.join(self.tempdir, "origin")
+        os.makedirs(self.origin)
+
+        git(self.origin, "init", "-q", "-b", "master")
+        commit_file(self.origin, "base")
+
+        for name in ("feature/one", "feature/two"):
+            git(self.origin, "checkout", "-q", "-b", name, "master")
+            commit_file(self.origin, name.replace("/", "-"))
+
+        git(self.origin, "checkout", "-q", "-b", "env/dev", "master")
+        for name in ("feature/one", "feature/two"):
+            git(self.origin, "merge", "-q", "--no-ff", "--no-edit", name)
+
+        git(self.origin, "checkout", "-q", "master")
+        commit_file(self.origin, "master-1")
+
+        self.clone = os.path.join(self.tempdir, "clone")
+        git(self.tempdir, "clone", "-q", f"file://{self.origin}", self.clone)
+        git(self.clone, "checkout", "-q", "env/dev")
+
+        os.chdir(self.clone)
+
+    def _replay(self):
+        return smash.Smash(clean_backups=True, coalesce=False).replay()
+
+    def test_replay(self, *mocks):
+        self.assertEquals(None, self._replay())
+
+        self.assertEquals(
+            git(self.clone, "rev-parse", "origin/master"),
+            git(self.clone, "merge-base", "HEAD", "origin/master"),
+        )
+        self.assertEquals(
+            ["feature-one", "feature-two"],
+            sorted(x for x in os.listdir(self.clone) if x.startswith("feature")),
+        )
+
+    def test_replay_unchanged_is_skipped(self, *mocks):
+        self._replay()
+        head_rev = git(self.clone, "rev-parse", "HEAD")
+
+        with mock.patch.object(smash.Smash, "apply_branch") as apply_branch:
+            self.assertEquals(smash.UNCHANGED_EXIT_STATUS, self._replay())
+
+        apply_branch.assert_not_called()
+        self.assertEquals(head_rev, git(self.clone, "rev-parse", "HEAD"))
+
+    def test_replay_same_trees_restores_commits(self, *mocks):
+        self._replay()
+        head_rev = git(self.clone, "rev-parse", "HEAD")
+
+        # forget about the last replay so that it is run again
+        os.remove(JSONCache(smash.REPLAYS_CACHE_NAME).path)
+
+        self.assertEquals(smash.UNCHANGED_EXIT_STATUS, self._replay())
+        self.assertEquals(head_rev, git(self.clone, "rev-parse", "HEAD"))
+
+    def test_replay_auto_optimize_once(self, *mocks):
+        """The commits a replay makes do not call for optimizing again"""
+        with mock.patch.object(
+            maintenance, "optimize", side_effect=maintenance.optimize
+        ) as optimize:
+            for _ in range(2):
+                smash.Smash(coalesce=False, auto_optimize=True).replay()
+
+        optimize.assert_called_once_with("origin/master", timed=False)
+
+    def test_replay_coalesced(self, *mocks):
+        """Requests queued while waiting for the lock are served by the same replay"""
+        replay = smash.Smash(clean_backups=True)
+
+        scheduler = ReplayScheduler("env/dev", options=replay.replay_options)
+        ticket = scheduler.submit()
+
+        self.assertEquals(None, replay.replay())
+
+        self.assertEquals(
+            {"ticket": mock.ANY, "status": None}, scheduler.pop_result(ticket)
+        )
+        self.assertEquals([], scheduler.get_pending())
+
+    def test_replay_does_not_coalesce_other_options(self, *mocks):
+        options = smash.Smash(drop_branches=["feature/two"]).replay_options
+        scheduler = ReplayScheduler("env/dev", options=options)
+        ticket = scheduler.submit()
+
+        self.assertEquals(None, smash.Smash(clean_backups=True).replay())
+
+        self.assertEquals(None, scheduler.pop_result(ticket))
+        self.assertEquals([ticket], scheduler.get_pending())
+
+    def _interrupt_replay(self):
+        """Replays, interrupting it when the second branch is about to be merged"""
+        apply_branch = smash.Smash.apply_branch
+        applied = []
+
+        def _apply_branch(instance, *args, **kwargs):
+            if applied:
+                raise KeyboardInterrupt()
+
+            applied.append(apply_branch(instance, *args, **kwargs))
+
+        with mock.patch.object(
+            smash.Smash, "apply_branch", autospec=True, side_effect=_apply_branch
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                self._replay()
+
+    def test_replay_interrupted_is_journaled(self, *mocks):
+        self._interrupt_replay()
+
+        journal = Journal("env/dev")
+        data = journal.load()
+
+        self.assertEquals(2, len(data["plan"]))
+        self.assertEquals(1, data["completed"])
+        self.assertEquals(git(self.clone, "rev-parse", "HEAD"), data["ref"])
+
+        # a new replay is refused until the interrupted one is dealt with
+        self.assertTrue(self._replay().startswith("ERROR"))
+
+    def test_replay_continue(self, *mocks):
+        self._interrupt_replay()
+
+        with mock.patch.object(
+            smash.Smash,
+            "apply_branch",
+            autospec=True,
+            side_effect=smash.Smash.apply_branch,
+        ) as apply_branch:
+            self.assertEquals(
+                None, smash.Smash(coalesce=False, resume=True).replay()
+            )
+
+        # only the merge that was not completed is redone
+        self.assertEquals(1, apply_branch.call_count)
+        self.assertFalse(Journal("env/dev").exists)
+        self.assertEquals(
+            ["feature-one", "feature-two"],
+            sorted(x for x in os.listdir(self.clone) if x.startswith("feature")),
+        )
+
+    def test_replay_continue_refuses_uncommitted_changes(self, *mocks):
+        self._interrupt_replay()
+
+        # e.g. a conflict resolution that was not committed when the replay got killed
+        with open(os.path.join(self.clone, "base"), "w") as fh:
+            fh.write("resolved\n")
+
+        self.assertTrue(
+            smash.Smash(coalesce=False, resume=True).replay().startswith("ERROR")
+        )
+
+        with open(os.path.join(self.clone, "base")) as fh:
+            self.assertEquals("resolved\n", fh.read())
+
+        self.assertTrue(Journal("env/dev").exists)
+
+    def test_replay_abort(self, *mocks):
+        backup_rev = git(self.clone, "rev-parse", "HEAD")
+
+        self._interrupt_replay()
+
+        with mock.patch.object(
+            ReplayScheduler,
+            "exclusive",
+            autospec=True,
+            side_effect=ReplayScheduler.exclusive,
+        ) as exclusive:
+            self.assertEquals(None, smash.Smash(abort=True).replay())
+
+        # aborting takes the locks, but does not serve queued requests
+        exclusive.assert_called_once()
+
+        self.assertFalse(Journal("env/dev").exists)
+        self.assertEquals(backup_rev, git(self.clone, "rev-parse", "HEAD"))
@@ -5,6 +5,49 @@ Test utilities
 import inspect
 import json
 import os
+import tempfile
+
+from unittest import TestCase, mock
+
+import sh
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+}
+
+
+class GitRepoTestCase(TestCase):
+    """
+    Runs each test with a git identity set, from a scratch directory at self.tempdir
+
+    Tests can chdir into the repos they create; the working directory is restored after
+    """
+
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+
+        self.tempdir = tempdir.name
+
+        patcher = mock.patch.dict(os.environ, GIT_ENV)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.addCleanup(os.chdir, os.getcwd())
+
+
+def commit_file(path, name, content=None):
+    """
+    Writes the given file in the repo at path and commits it
+    """
+    with open(os.path.join(path, name), "w") as fh:
+        fh.write(content or f"{name}\n")
+
+    git(path, "add", name)
+    git(path, "commit", "-m", f"add {name}")
 
 
 def get_content(filename):
@@ -44,3 +87,10 @@ def get_json(filename):
     Returns the content of the given filename as a parsed JSON object
     """
     return json.loads(get_content(filename))
+
+
+def git(path, *args):
+    """
+    Runs git in the given repo and returns its output
+    """
+    return str(sh.git(*args, _cwd=path)).strip()